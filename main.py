@@ -2,9 +2,15 @@
 
 # -- phase 1: rough file tree structure generation
 
-import json
-import pdfplumber
-from openai import OpenAI
+import asyncio
+import functools
+import hashlib
+import os
+import re
+from pathlib import Path
+import orjson
+from openai import AsyncOpenAI, NotFoundError
+from pdf_text import get_page_count, iter_page_texts
 from utils import (
     print_section,
     create_json_structure_artifact,
@@ -17,86 +23,244 @@ from prefect import flow, task
 from prefect.cache_policies import INPUTS, TASK_SOURCE
 from datetime import timedelta
 
-client = OpenAI()
+client = AsyncOpenAI()
 
+# How often to check on a submitted OpenAI batch job
+BATCH_POLL_INTERVAL_SECONDS = 30
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Maps sha256 of PDF bytes -> OpenAI file_id of an earlier upload of those bytes
+UPLOAD_CACHE_PATH = Path.home() / ".cache" / "datasheet_loader" / "uploads.json"
+
+
+def build_tree_structure_request(file_id: str, file_tree_prompt: str) -> dict:
+    """Returns the Responses API request body for initial tree generation"""
+    return {
+        "model": "gpt-4.1",
+        "input": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_file",
+                        "file_id": file_id,
+                    },
+                    {
+                        "type": "input_text",
+                        "text": file_tree_prompt,
+                    },
+                ],
+            }
+        ],
+    }
+
+
+def build_refinement_request(refine_prompt: str) -> dict:
+    """Returns the Responses API request body for tree refinement"""
+    return {
+        "model": "gpt-4.1",
+        "input": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": refine_prompt,
+                    },
+                ],
+            }
+        ],
+    }
+
+
+def _response_output_text(response_body: dict) -> str:
+    """Collect the output text from a raw Responses API body in a batch result"""
+    return "".join(
+        part["text"]
+        for item in response_body.get("output", [])
+        if item.get("type") == "message"
+        for part in item.get("content", [])
+        if part.get("type") == "output_text"
+    )
+
+
+def _file_sha256(pdf_file_path: str) -> str:
+    """Returns the sha256 hex digest of the PDF's bytes"""
+    with open(pdf_file_path, "rb") as pdf_file:
+        return hashlib.file_digest(pdf_file, "sha256").hexdigest()
+
+
+def _load_upload_cache() -> dict:
+    """Read the upload cache, treating a missing or corrupt file as empty"""
+    try:
+        return orjson.loads(UPLOAD_CACHE_PATH.read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
 
-@task
-def extract_headers_and_summary_with_pdfplumber(pdf_path, max_pages=5):
-    """Extract headers and basic content summary using pdfplumber"""
-    # Minimal logging for task start
-    print(f"Extracting headers from: {pdf_path}")
 
+async def _upload_or_reuse(pdf_file_path: str, digest: str = None) -> str:
+    """Upload a PDF to OpenAI, reusing an earlier upload of identical bytes.
+
+    Args:
+        pdf_file_path (str): Path to the PDF file
+        digest (str): Precomputed sha256 of the file, if available
+
+    Returns:
+        str: OpenAI file_id of the uploaded PDF
+    """
+    if digest is None:
+        digest = _file_sha256(pdf_file_path)
+
+    file_id = _load_upload_cache().get(digest)
+    if file_id:
+        try:
+            # Uploaded files can be deleted or expire on OpenAI's side
+            await client.files.retrieve(file_id)
+            return file_id
+        except NotFoundError:
+            pass
+
+    # httpx streams the open handle in chunks and sizes it for Content-Length
+    with open(pdf_file_path, "rb") as pdf_file:
+        file = await client.files.create(
+            file=(Path(pdf_file_path).name, pdf_file, "application/pdf"),
+            purpose="user_data",
+        )
+
+    # Re-read right before writing so concurrent uploads don't drop each other
+    upload_cache = _load_upload_cache()
+    upload_cache[digest] = file.id
+    UPLOAD_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    UPLOAD_CACHE_PATH.write_bytes(
+        orjson.dumps(upload_cache, option=orjson.OPT_INDENT_2)
+    )
+
+    return file.id
+
+
+def _artifact_key(prefix: str, pdf_path: str) -> str:
+    """Build a per-PDF artifact key (lowercase letters, numbers and dashes)"""
+    slug = re.sub(r"[^a-z0-9]+", "-", Path(pdf_path).stem.lower()).strip("-")
+    return f"{prefix}-{slug}"
+
+
+# Keyed on the file's modification time as well as its path, so an edited PDF
+# is re-read; repeated task runs within one process reuse the parse
+@functools.lru_cache(maxsize=32)
+def _extract_headers_and_summary(
+    pdf_path, mtime_ns, max_pages, num_workers, use_plumber
+):
+    """Run header/summary extraction for `extract_headers_and_summary_with_pdfplumber`
+
+    Returns:
+        tuple: (headers, content_summary, total_pages, processed_count), with the
+            lists as tuples so cached results can't be mutated by callers
+    """
     headers = []
     content_summary = []
 
-    with pdfplumber.open(pdf_path) as pdf:
-        total_pages = len(pdf.pages)
-        print(
-            f"Processing {min(max_pages if max_pages not in [None, -1] else total_pages, total_pages)} of {total_pages} pages"
-        )
+    total_pages = get_page_count(pdf_path)
+
+    # Handle max_pages = None or -1 for entire file
+    if max_pages is None or max_pages == -1:
+        processed_count = total_pages
+    else:
+        processed_count = min(max_pages, total_pages)
+
+    print(f"Processing {processed_count} of {total_pages} pages")
+
+    # Page text is extracted in worker processes; the heuristics below run here
+    pages = iter_page_texts(pdf_path, processed_count, num_workers, use_plumber)
+    for page_num, text in pages:
+        # Minimal progress logging
+        if page_num % 5 == 0:  # Log every 5th page
+            print(f"Processing page {page_num + 1}...")
+
+        if text:
+            # Strip once; both the header filter and the summary use stripped lines
+            lines = [line.strip() for line in text.split("\n")]
+
+            # Simple header detection (lines that are short, uppercase, or numbered)
+            headers.extend(
+                f"Page {page_num + 1}: {line}"
+                for line in lines
+                if line
+                and len(line) < 50
+                and (
+                    line.isupper()
+                    # Starts with 1-19, i.e. any digit but 0 (not "0x..." values)
+                    or line[0] in "123456789"
+                    or line.count(".") >= 2
+                )  # Likely section numbering
+            )
+
+            # Use the first meaningful line as the summary
+            first_meaningful_line = next(
+                (line for line in lines if len(line) > 20), None
+            )
+            if first_meaningful_line:
+                content_summary.append(
+                    f"Page {page_num + 1}: {first_meaningful_line[:100]}..."
+                )
+
+    return tuple(headers), tuple(content_summary), total_pages, processed_count
+
 
-        # Handle max_pages = None or -1 for entire file
-        if max_pages is None or max_pages == -1:
-            pages_to_process = pdf.pages
-            processed_count = total_pages
-        else:
-            pages_to_process = pdf.pages[:max_pages]
-            processed_count = min(max_pages, total_pages)
-
-        for page_num, page in enumerate(pages_to_process):
-            # Minimal progress logging
-            if page_num % 5 == 0:  # Log every 5th page
-                print(f"Processing page {page_num + 1}...")
-
-            text = page.extract_text()
-            if text:
-                lines = text.split("\n")
-
-                # Simple header detection (lines that are short, uppercase, or numbered)
-                for line in lines:
-                    line = line.strip()
-                    if line and (
-                        len(line) < 50
-                        and (
-                            line.isupper()
-                            or any(line.startswith(str(i)) for i in range(1, 20))
-                            or line.count(".") >= 2
-                        )  # Likely section numbering
-                    ):
-                        headers.append(f"Page {page_num + 1}: {line}")
-
-                # Extract first few meaningful lines as summary
-                meaningful_lines = [
-                    line.strip() for line in lines if len(line.strip()) > 20
-                ]
-                if meaningful_lines:
-                    content_summary.append(
-                        f"Page {page_num + 1}: {meaningful_lines[0][:100]}..."
-                    )
+@task
+def extract_headers_and_summary_with_pdfplumber(
+    pdf_path, max_pages=5, num_workers=None, use_plumber=False
+):
+    """Extract headers and basic content summary from the PDF text layer
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        max_pages (int or None): Number of pages to process. Use None or -1 for entire file
+        num_workers (int or None): Worker processes for page extraction. None or 1
+            extracts in-process.
+        use_plumber (bool): Extract text with pdfplumber instead of pypdfium2.
+            Slower, but keeps pdfplumber's layout-ordered lines and headers.
+    """
+    # Minimal logging for task start
+    print(f"Extracting headers from: {pdf_path}")
+
+    headers, content_summary, total_pages, processed_count = (
+        _extract_headers_and_summary(
+            pdf_path,
+            os.stat(pdf_path).st_mtime_ns,
+            max_pages,
+            num_workers,
+            use_plumber,
+        )
+    )
 
     # Create artifacts for the extracted data
-    create_headers_table_artifact(headers, "pdf-headers")
-    create_content_summary_artifact(content_summary, "pdf-content-summary")
+    create_headers_table_artifact(list(headers), "pdf-headers")
+    create_content_summary_artifact(list(content_summary), "pdf-content-summary")
     create_processing_summary_artifact(
         pdf_path, total_pages, processed_count, "pdf-processing-summary"
     )
 
-    return headers, content_summary
+    return list(headers), list(content_summary)
 
 
+# Cached on the PDF's content digest rather than its path, so a moved or renamed
+# copy of the same datasheet hits the cache and an edited one does not
 @task(
-    cache_policy=INPUTS - "debug_mode",
+    cache_policy=INPUTS - "debug_mode" - "pdf_file_path",
     cache_expiration=timedelta(hours=24),
     persist_result=True,
-    refresh_cache=True,
 )
-def generate_initial_tree_structure_with_openai(
-    pdf_file_path: str, file_tree_prompt: str, debug_mode: bool = True
+async def generate_initial_tree_structure_with_openai(
+    pdf_file_path: str,
+    pdf_digest: str,
+    file_tree_prompt: str,
+    debug_mode: bool = True,
 ):
     """Generate initial tree structure from PDF using OpenAI API.
 
     Args:
         pdf_file_path (str): Path to the PDF file
+        pdf_digest (str): sha256 of the PDF bytes, used as the cache identity
         file_tree_prompt (str): Prompt for tree structure generation
         debug_mode (bool): Whether to show detailed debug output
 
@@ -106,35 +270,20 @@ def generate_initial_tree_structure_with_openai(
     if debug_mode:
         print(f"Uploading and processing PDF: {pdf_file_path}")
 
-    # Upload file to OpenAI (only happens on cache miss)
-    file = client.files.create(file=open(pdf_file_path, "rb"), purpose="user_data")
+    # Upload file to OpenAI (only happens on cache miss; reuses earlier uploads)
+    file_id = await _upload_or_reuse(pdf_file_path, pdf_digest)
 
     if debug_mode:
-        print(f"File uploaded successfully. ID: {file.id}")
+        print(f"File uploaded successfully. ID: {file_id}")
 
-    response = client.responses.create(
-        model="gpt-4.1",
-        input=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "input_file",
-                        "file_id": file.id,
-                    },
-                    {
-                        "type": "input_text",
-                        "text": file_tree_prompt,
-                    },
-                ],
-            }
-        ],
+    response = await client.responses.create(
+        **build_tree_structure_request(file_id, file_tree_prompt)
     )
 
     ai_tree_structure = response.output_text
 
     # Create artifact for the AI-generated structure
-    create_json_structure_artifact(
+    await create_json_structure_artifact(
         json_content=ai_tree_structure,
         title="AI-Generated File Structure",
         key="ai-tree-structure",
@@ -152,7 +301,7 @@ def generate_initial_tree_structure_with_openai(
     cache_expiration=timedelta(hours=24),
     persist_result=True,
 )
-def refine_tree_structure_with_openai(
+async def refine_tree_structure_with_openai(
     ai_structure: str, headers: list, content_summary: list, debug_mode: bool = True
 ):
     """Refine tree structure based on AI structure and extracted PDF content.
@@ -171,25 +320,14 @@ def refine_tree_structure_with_openai(
 
     refine_prompt = get_refinement_prompt(ai_structure, headers, content_summary)
 
-    refinement_response = client.responses.create(
-        model="gpt-4.1",
-        input=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "input_text",
-                        "text": refine_prompt,
-                    },
-                ],
-            }
-        ],
+    refinement_response = await client.responses.create(
+        **build_refinement_request(refine_prompt)
     )
 
     refined_structure = refinement_response.output_text
 
     # Create artifact for the refined structure
-    create_json_structure_artifact(
+    await create_json_structure_artifact(
         json_content=refined_structure,
         title="Refined File Structure",
         key="refined-tree-structure",
@@ -203,13 +341,17 @@ def refine_tree_structure_with_openai(
 
 
 @flow
-def load_pdf(pdf_file_path, max_pages=5, debug_mode=True):
+async def load_pdf(
+    pdf_file_path, max_pages=5, debug_mode=True, num_workers=None, use_plumber=False
+):
     """Main function to process PDF and generate file tree structure
 
     Args:
         pdf_file_path (str): Path to the PDF file
         max_pages (int or None): Number of pages to process. Use None or -1 for entire file
         debug_mode (bool): Whether to show detailed debug output
+        num_workers (int or None): Worker processes for PDF page extraction
+        use_plumber (bool): Extract text with pdfplumber instead of pypdfium2
     """
 
     pages_desc = (
@@ -223,25 +365,30 @@ def load_pdf(pdf_file_path, max_pages=5, debug_mode=True):
     # Step 1: Get tree generation prompt
     file_tree_prompt = get_file_tree_prompt()
 
-    # Step 1: Generate initial tree structure (cached task)
-    ai_tree_structure = generate_initial_tree_structure_with_openai(
+    # Step 2: Extract headers and content from the PDF text in Prefect's task
+    # runner while the initial tree is generated; neither depends on the other
+    headers_future = extract_headers_and_summary_with_pdfplumber.submit(
+        pdf_file_path, max_pages, num_workers, use_plumber
+    )
+
+    # Step 3: Generate initial tree structure (cached task). Awaited here rather
+    # than submitted so the shared AsyncOpenAI client stays on this event loop
+    ai_tree_structure = await generate_initial_tree_structure_with_openai(
         pdf_file_path=pdf_file_path,
+        pdf_digest=_file_sha256(pdf_file_path),
         file_tree_prompt=file_tree_prompt,
         debug_mode=debug_mode,
     )
 
-    # Step 2: Extract headers and content using pdfplumber
-    headers, content_summary = extract_headers_and_summary_with_pdfplumber(
-        pdf_file_path, max_pages
-    )
+    headers, content_summary = headers_future.result()
 
     if debug_mode:
         print(
             f"Extracted {len(headers)} headers and {len(content_summary)} content summaries"
         )
 
-    # Step 3: Refine structure (cached task)
-    refined_structure = refine_tree_structure_with_openai(
+    # Step 4: Refine structure (cached task)
+    refined_structure = await refine_tree_structure_with_openai(
         ai_structure=ai_tree_structure,
         headers=headers,
         content_summary=content_summary,
@@ -262,10 +409,197 @@ def load_pdf(pdf_file_path, max_pages=5, debug_mode=True):
     }
 
 
+@task
+async def submit_openai_batch(requests: dict, debug_mode: bool = True) -> str:
+    """Submit Responses API requests as a single OpenAI batch job.
+
+    Args:
+        requests (dict): Request bodies keyed by custom_id
+        debug_mode (bool): Whether to show detailed debug output
+
+    Returns:
+        str: ID of the submitted batch
+    """
+    batch_input = b"\n".join(
+        orjson.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/responses",
+                "body": body,
+            }
+        )
+        for custom_id, body in requests.items()
+    )
+
+    batch_file = await client.files.create(
+        file=("batch_input.jsonl", batch_input), purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/responses",
+        completion_window="24h",
+    )
+
+    if debug_mode:
+        print(f"Submitted batch {batch.id} with {len(requests)} requests")
+
+    return batch.id
+
+
+@task
+async def collect_openai_batch(batch_id: str, debug_mode: bool = True) -> dict:
+    """Wait for an OpenAI batch job to finish and collect its output text.
+
+    Args:
+        batch_id (str): ID returned by `submit_openai_batch`
+        debug_mode (bool): Whether to show detailed debug output
+
+    Returns:
+        dict: Output text keyed by custom_id
+    """
+    batch = await client.batches.retrieve(batch_id)
+    while batch.status not in BATCH_TERMINAL_STATUSES:
+        if debug_mode:
+            print(f"Batch {batch_id} is {batch.status}, checking again shortly...")
+        await asyncio.sleep(BATCH_POLL_INTERVAL_SECONDS)
+        batch = await client.batches.retrieve(batch_id)
+
+    if batch.status != "completed":
+        raise RuntimeError(
+            f"OpenAI batch {batch_id} ended with status {batch.status}"
+        )
+
+    outputs = {}
+    failed = []
+    if batch.output_file_id:
+        batch_output = await client.files.content(batch.output_file_id)
+        for line in batch_output.content.splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                failed.append(record["custom_id"])
+                continue
+            outputs[record["custom_id"]] = _response_output_text(response["body"])
+
+    if failed or batch.error_file_id:
+        raise RuntimeError(
+            f"OpenAI batch {batch_id} had failed requests: "
+            f"{failed or batch.error_file_id}"
+        )
+
+    if debug_mode:
+        print(f"Batch {batch_id} completed with {len(outputs)} responses")
+
+    return outputs
+
+
+@flow
+async def load_pdfs(
+    pdf_file_paths: list,
+    max_pages=5,
+    debug_mode=True,
+    num_workers=None,
+    use_plumber=False,
+):
+    """Process many PDFs, sending their OpenAI requests through the Batch API
+
+    Tree generation prompts for every PDF go out as one batch job, followed by
+    a second batch with the refinement prompts. A single PDF falls back to
+    `load_pdf`, which calls the API directly.
+
+    Args:
+        pdf_file_paths (list): Paths to the PDF files
+        max_pages (int or None): Number of pages to process. Use None or -1 for entire file
+        debug_mode (bool): Whether to show detailed debug output
+        num_workers (int or None): Worker processes for PDF page extraction
+        use_plumber (bool): Extract text with pdfplumber instead of pypdfium2
+
+    Returns:
+        dict: `load_pdf`-style results keyed by PDF path
+    """
+    if not pdf_file_paths:
+        return {}
+
+    if len(pdf_file_paths) == 1:
+        pdf_file_path = pdf_file_paths[0]
+        return {
+            pdf_file_path: await load_pdf(
+                pdf_file_path, max_pages, debug_mode, num_workers, use_plumber
+            )
+        }
+
+    if debug_mode:
+        print(f"Starting batch processing of {len(pdf_file_paths)} PDFs")
+
+    file_tree_prompt = get_file_tree_prompt()
+
+    # Phase 1: Upload every PDF and submit all tree generation prompts as one batch
+    file_ids = await asyncio.gather(*map(_upload_or_reuse, pdf_file_paths))
+    tree_requests = {
+        f"tree-{i}": build_tree_structure_request(file_id, file_tree_prompt)
+        for i, file_id in enumerate(file_ids)
+    }
+    tree_batch_id = await submit_openai_batch(tree_requests, debug_mode)
+
+    # Extract headers locally while the batch runs
+    extracted = [
+        extract_headers_and_summary_with_pdfplumber(
+            pdf_file_path, max_pages, num_workers, use_plumber
+        )
+        for pdf_file_path in pdf_file_paths
+    ]
+
+    ai_tree_structures = await collect_openai_batch(tree_batch_id, debug_mode)
+
+    # Phase 2: Submit all refinement prompts as a second batch
+    refine_requests = {
+        f"refine-{i}": build_refinement_request(
+            get_refinement_prompt(ai_tree_structures[f"tree-{i}"], headers, summary)
+        )
+        for i, (headers, summary) in enumerate(extracted)
+    }
+    refine_batch_id = await submit_openai_batch(refine_requests, debug_mode)
+    refined_structures = await collect_openai_batch(refine_batch_id, debug_mode)
+
+    results = {}
+    for i, pdf_file_path in enumerate(pdf_file_paths):
+        headers, content_summary = extracted[i]
+        ai_tree_structure = ai_tree_structures[f"tree-{i}"]
+        refined_structure = refined_structures[f"refine-{i}"]
+
+        await create_json_structure_artifact(
+            json_content=ai_tree_structure,
+            title=f"AI-Generated File Structure ({Path(pdf_file_path).name})",
+            key=_artifact_key("ai-tree-structure", pdf_file_path),
+            description="Initial file structure generated by AI analysis of the datasheet PDF. This provides a comprehensive organization based on typical datasheet sections.",
+        )
+        await create_json_structure_artifact(
+            json_content=refined_structure,
+            title=f"Refined File Structure ({Path(pdf_file_path).name})",
+            key=_artifact_key("refined-tree-structure", pdf_file_path),
+            description="Final refined file structure that combines AI analysis with extracted PDF headers. This represents the optimal organization for the datasheet content.",
+        )
+
+        results[pdf_file_path] = {
+            "ai_structure": ai_tree_structure,
+            "headers": headers,
+            "content_summary": content_summary,
+            "refined_structure": refined_structure,
+        }
+
+    if debug_mode:
+        print(f"Batch processing of {len(pdf_file_paths)} PDFs completed!")
+
+    return results
+
+
 if __name__ == "__main__":
     # Configuration
     PDF_FILE_PATH = "example_data_sheets/BST-BMP280-DS001-11.pdf"
 
     # Run the PDF processing
     # Use max_pages=None or max_pages=-1 to process entire file
-    result = load_pdf(PDF_FILE_PATH, max_pages=5, debug_mode=True)
+    result = asyncio.run(load_pdf(PDF_FILE_PATH, max_pages=5, debug_mode=True))
@@ -0,0 +1,100 @@
+# pdf_text.py
+# Page text extraction shared by main.py and simple_main.py
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pdfplumber
+import pypdfium2 as pdfium
+
+
+def _pdfium_page_text(page):
+    """Returns the plain text of a pypdfium2 page with newline line endings.
+
+    Closes the page afterwards so only one page's native objects are alive at a
+    time, however long the document is.
+    """
+    textpage = page.get_textpage()
+    try:
+        text = textpage.get_text_range()
+    finally:
+        textpage.close()
+        page.close()
+
+    # PDFium separates lines with CRLF; callers split on "\n"
+    return text.replace("\r\n", "\n")
+
+
+def _iter_page_range(pdf_path, start, stop, use_plumber=False):
+    """Yield the text of (0-indexed) pages `start` to `stop - 1`.
+
+    The document is opened once for the whole range.
+    """
+    if use_plumber:
+        with pdfplumber.open(pdf_path) as pdf:
+            for page_num in range(start, stop):
+                page = pdf.pages[page_num]
+                text = page.extract_text()
+                # Drop the page's cached layout objects before moving on
+                page.close()
+                yield text
+    else:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            for page_num in range(start, stop):
+                yield _pdfium_page_text(pdf[page_num])
+        finally:
+            pdf.close()
+
+
+def _extract_page_range(pdf_path, start, stop, use_plumber=False):
+    """Returns the texts of pages `start` to `stop - 1`; runs in a worker process"""
+    return list(_iter_page_range(pdf_path, start, stop, use_plumber))
+
+
+def iter_page_texts(pdf_path, page_count, num_workers=None, use_plumber=False):
+    """Yield `(page_num, text)` for the first `page_count` pages, in order.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        page_count (int): Number of pages to extract, starting from the first
+        num_workers (int or None): Worker processes to split the pages across.
+            None or 1 extracts in-process, which is fastest unless the document
+            is very long; each worker opens the PDF once for its page range.
+        use_plumber (bool): Extract with pdfplumber instead of pypdfium2. Slower,
+            but keeps pdfplumber's layout-ordered lines.
+    """
+    num_workers = min(num_workers or 1, page_count)
+
+    if num_workers <= 1:
+        yield from enumerate(_iter_page_range(pdf_path, 0, page_count, use_plumber))
+        return
+
+    # One contiguous page range per worker
+    bounds = [page_count * i // num_workers for i in range(num_workers + 1)]
+
+    # The pool may be created from a Prefect task-runner thread; forking a
+    # multi-threaded process can leave the child holding another thread's locks
+    mp_context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as ex:
+        ranges = ex.map(
+            partial(_extract_page_range, pdf_path, use_plumber=use_plumber),
+            bounds[:-1],
+            bounds[1:],
+        )
+        page_num = 0
+        for texts in ranges:
+            for text in texts:
+                yield page_num, text
+                page_num += 1
+
+
+def get_page_count(pdf_path):
+    """Returns the number of pages in the PDF"""
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
@@ -2,17 +2,70 @@
 """
 Simple PDF Header-Based Chunker
 Extracts content from PDF datasheets and organizes it into files based on detected headers.
-Uses only pdfplumber and standard libraries - no AI required.
+Uses only local PDF text extraction and standard libraries - no AI required.
 """
 
 import os
 import re
 import json
-import pdfplumber
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Iterable, Iterator, Tuple, Optional
 from prefect import flow, task
 
+from pdf_text import get_page_count, iter_page_texts
+
+# Section numbering at the start of a line (1.1, 2.3.1, etc.)
+_SECTION_NUMBER = re.compile(r'^\d+(\.\d+)*\.?\s+[A-Z]')
+
+# Keywords that mark a line as a header, matched case-insensitively in one scan
+_HEADER_KEYWORDS = re.compile(
+    'introduction|overview|specification|features|description|operation|'
+    'configuration|registers|timing|electrical|mechanical|package',
+    re.IGNORECASE
+)
+
+
+def _is_header(line: str) -> bool:
+    """Check a stripped, non-empty line against the header heuristics."""
+    # Check for section numbering (1.1, 2.3.1, etc.)
+    if _SECTION_NUMBER.match(line):
+        return True
+    
+    words = line.split()
+    
+    # Check for all caps headers (short lines)
+    if len(line) < 80 and line.isupper() and len(words) > 1:
+        return True
+    
+    # Check for title case headers with specific patterns
+    if (len(line) < 60 and 
+            line.istitle() and 
+            not line.endswith('.') and
+            len(words) > 1):
+        return True
+    
+    # Check for headers with specific keywords
+    return len(line) < 80 and _HEADER_KEYWORDS.search(line) is not None
+
+
+# Header keywords that place a chunk in a category; checked in order, first match wins
+_CATEGORY_PATTERNS = [
+    (re.compile('register|configuration|control', re.IGNORECASE), "registers"),
+    (re.compile('timing|electrical|specification', re.IGNORECASE), "specifications"),
+    (re.compile('feature|overview|description', re.IGNORECASE), "overview"),
+    (re.compile('operation|mode|function', re.IGNORECASE), "operation"),
+    (re.compile('package|mechanical|pin', re.IGNORECASE), "mechanical"),
+]
+
+# Patterns used by clean_filename, which runs once per chunk
+_LEADING_SECTION_NUMBER = re.compile(r'^\d+(\.\d+)*\.?\s*')
+_NON_FILENAME_CHARS = re.compile(r'[^a-zA-Z0-9\s]')
+_WHITESPACE_RUN = re.compile(r'\s+')
+
+# Concurrent writes used when saving the generated markdown files
+MAX_WRITE_WORKERS = 16
+
 
 class PDFHeaderChunker:
     """Simple PDF processor that chunks content by detected headers."""
@@ -22,85 +75,60 @@ class PDFHeaderChunker:
         self.headers = []
         self.content_chunks = []
         
-    def detect_headers(self, text: str) -> List[str]:
-        """Detect headers in text using simple heuristics."""
-        lines = text.split('\n')
-        headers = []
+    def iter_chunks(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, List[str]]]:
+        """Stream content chunks from `(page_num, text)` pages.
+
+        Yields `(header, lines)` for the content between detected headers as
+        pages arrive; the open chunk carries over page boundaries, so the
+        document text is never held in memory as a whole. Every detected header
+        (duplicates included) is recorded in `self.headers`.
+        """
+        self.headers = []
+        current_header = "Introduction"
+        current_lines = []
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Header detection heuristics
-            is_header = False
-            
-            # Check for section numbering (1.1, 2.3.1, etc.)
-            if re.match(r'^\d+(\.\d+)*\.?\s+[A-Z]', line):
-                is_header = True
-            
-            # Check for all caps headers (short lines)
-            elif len(line) < 80 and line.isupper() and len(line.split()) > 1:
-                is_header = True
-            
-            # Check for title case headers with specific patterns
-            elif (len(line) < 60 and 
-                  line.istitle() and 
-                  not line.endswith('.') and
-                  len(line.split()) > 1):
-                is_header = True
+        for page_num, text in pages:
+            if page_num % 10 == 0:
+                print(f"  Processing page {page_num + 1}...")
             
-            # Check for headers with specific keywords
-            elif any(keyword in line.lower() for keyword in [
-                'introduction', 'overview', 'specification', 'features',
-                'description', 'operation', 'configuration', 'registers',
-                'timing', 'electrical', 'mechanical', 'package'
-            ]) and len(line) < 80:
-                is_header = True
+            if not text:
+                continue
             
-            if is_header:
-                headers.append(line)
-        
-        return headers
-    
-    def extract_content_between_headers(self, text: str, headers: List[str]) -> List[Dict]:
-        """Extract content between detected headers."""
-        if not headers:
-            return [{"header": "Main Content", "content": text}]
-        
-        chunks = []
-        lines = text.split('\n')
-        current_chunk = {"header": "Introduction", "content": ""}
-        
-        for line in lines:
-            line_stripped = line.strip()
+            current_lines.append(f"--- PAGE {page_num + 1} ---")
             
-            # Check if this line is a header
-            if line_stripped in headers:
-                # Save current chunk if it has content
-                if current_chunk["content"].strip():
-                    chunks.append(current_chunk)
+            # Detect headers and split chunks in the same pass over the lines
+            for line in text.split('\n'):
+                line_stripped = line.strip()
                 
-                # Start new chunk
-                current_chunk = {"header": line_stripped, "content": ""}
-            else:
-                # Add line to current chunk
-                current_chunk["content"] += line + '\n'
-        
-        # Add final chunk
-        if current_chunk["content"].strip():
-            chunks.append(current_chunk)
+                # Check if this line is a header
+                if line_stripped and _is_header(line_stripped):
+                    self.headers.append(line_stripped)
+                    
+                    # Save current chunk if it has content
+                    if any(l.strip() for l in current_lines):
+                        yield current_header, current_lines
+                    
+                    # Start new chunk
+                    current_header = line_stripped
+                    current_lines = []
+                else:
+                    # Add line to current chunk
+                    current_lines.append(line)
         
-        return chunks
+        # Add final chunk; a document without headers is one chunk
+        if not self.headers:
+            yield "Main Content", current_lines
+        elif any(l.strip() for l in current_lines):
+            yield current_header, current_lines
     
     def clean_filename(self, text: str) -> str:
         """Convert header text to clean filename."""
         # Remove section numbers
-        text = re.sub(r'^\d+(\.\d+)*\.?\s*', '', text)
+        text = _LEADING_SECTION_NUMBER.sub('', text)
         
         # Convert to lowercase and replace spaces/special chars
-        text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
-        text = re.sub(r'\s+', '_', text.strip())
+        text = _NON_FILENAME_CHARS.sub('', text)
+        text = _WHITESPACE_RUN.sub('_', text.strip())
         text = text.lower()
         
         # Limit length
@@ -118,18 +146,10 @@ class PDFHeaderChunker:
             content = chunk["content"]
             
             # Determine directory based on header content
-            if any(keyword in header.lower() for keyword in ['register', 'configuration', 'control']):
-                category = "registers"
-            elif any(keyword in header.lower() for keyword in ['timing', 'electrical', 'specification']):
-                category = "specifications"
-            elif any(keyword in header.lower() for keyword in ['feature', 'overview', 'description']):
-                category = "overview"
-            elif any(keyword in header.lower() for keyword in ['operation', 'mode', 'function']):
-                category = "operation"
-            elif any(keyword in header.lower() for keyword in ['package', 'mechanical', 'pin']):
-                category = "mechanical"
-            else:
-                category = "general"
+            category = next(
+                (name for pattern, name in _CATEGORY_PATTERNS if pattern.search(header)),
+                "general"
+            )
             
             if category not in structure:
                 structure[category] = []
@@ -149,7 +169,10 @@ class PDFHeaderChunker:
         base_dir = self.output_dir / pdf_name.replace('.pdf', '')
         base_dir.mkdir(parents=True, exist_ok=True)
         
-        # Write files organized by category
+        # Collect files first so each category directory is created once before
+        # any writes start. A later chunk with the same filename still replaces
+        # an earlier one, as it did when files were written one at a time.
+        files_to_write = {}
         for category, files in structure.items():
             category_dir = base_dir / category
             category_dir.mkdir(exist_ok=True)
@@ -159,11 +182,17 @@ class PDFHeaderChunker:
                 
                 # Create markdown content
                 content = f"# {file_info['header']}\n\n{file_info['content']}"
-                
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                print(f"Created: {file_path}")
+                files_to_write[file_path] = content
+        
+        # Many small files: keep several writes in flight at once
+        with ThreadPoolExecutor(max_workers=MAX_WRITE_WORKERS) as ex:
+            list(ex.map(
+                lambda item: item[0].write_text(item[1], encoding='utf-8'),
+                files_to_write.items()
+            ))
+        
+        for file_path in files_to_write:
+            print(f"Created: {file_path}")
         
         # Create index file
         self.create_index_file(base_dir, structure)
@@ -185,49 +214,38 @@ class PDFHeaderChunker:
         
         print(f"Created: {base_dir / 'README.md'}")
     
-    def process_pdf(self, pdf_path: str, max_pages: Optional[int] = None) -> Dict:
-        """Main processing function."""
+    def process_pdf(self, pdf_path: str, max_pages: Optional[int] = None,
+                    num_workers: Optional[int] = None, use_plumber: bool = False) -> Dict:
+        """Main processing function.
+
+        Page text is extracted across `num_workers` processes (None or 1
+        extracts in-process). `use_plumber` extracts with pdfplumber instead of
+        pypdfium2, keeping its layout-ordered lines and therefore its headers.
+        """
         print(f"Processing PDF: {pdf_path}")
         
-        all_text = ""
-        all_headers = []
+        total_pages = get_page_count(pdf_path)
+        # Handle max_pages = None or -1 for entire file
+        if max_pages is None or max_pages == -1:
+            pages_to_process = total_pages
+        else:
+            pages_to_process = min(max_pages, total_pages)
         
-        with pdfplumber.open(pdf_path) as pdf:
-            total_pages = len(pdf.pages)
-            # Handle max_pages = None or -1 for entire file
-            if max_pages is None or max_pages == -1:
-                pages_to_process = total_pages
-            else:
-                pages_to_process = min(max_pages, total_pages)
-            
-            print(f"Processing {pages_to_process} of {total_pages} pages")
-            
-            for page_num, page in enumerate(pdf.pages[:pages_to_process]):
-                if page_num % 10 == 0:
-                    print(f"  Processing page {page_num + 1}...")
-                
-                text = page.extract_text()
-                if text:
-                    all_text += f"\n--- PAGE {page_num + 1} ---\n" + text
-                    
-                    # Extract headers from this page
-                    page_headers = self.detect_headers(text)
-                    all_headers.extend(page_headers)
+        print(f"Processing {pages_to_process} of {total_pages} pages")
         
-        print(f"Detected {len(all_headers)} potential headers")
+        # Extract content chunks as page text streams in
+        pages = iter_page_texts(pdf_path, pages_to_process, num_workers, use_plumber)
+        chunks = [
+            {"header": header, "content": '\n'.join(lines)}
+            for header, lines in self.iter_chunks(pages)
+        ]
+        
+        print(f"Detected {len(self.headers)} potential headers")
         
         # Remove duplicates while preserving order
-        unique_headers = []
-        seen = set()
-        for header in all_headers:
-            if header not in seen:
-                unique_headers.append(header)
-                seen.add(header)
+        unique_headers = list(dict.fromkeys(self.headers))
         
         print(f"Found {len(unique_headers)} unique headers")
-        
-        # Extract content chunks
-        chunks = self.extract_content_between_headers(all_text, unique_headers)
         print(f"Created {len(chunks)} content chunks")
         
         # Create directory structure
@@ -248,7 +266,8 @@ class PDFHeaderChunker:
 
 
 @task
-def process_pdf_with_chunker(pdf_file_path: str, output_dir: str, max_pages: Optional[int] = None) -> Dict:
+def process_pdf_with_chunker(pdf_file_path: str, output_dir: str, max_pages: Optional[int] = None,
+                             num_workers: Optional[int] = None, use_plumber: bool = False) -> Dict:
     """Task to process PDF with the header-based chunker"""
     # Check if PDF exists
     if not os.path.exists(pdf_file_path):
@@ -261,7 +280,8 @@ def process_pdf_with_chunker(pdf_file_path: str, output_dir: str, max_pages: Opt
     
     # Process PDF
     try:
-        result = processor.process_pdf(pdf_file_path, max_pages=max_pages)
+        result = processor.process_pdf(pdf_file_path, max_pages=max_pages, num_workers=num_workers,
+                                       use_plumber=use_plumber)
         
         print("\n" + "="*50)
         print("PROCESSING COMPLETE")
@@ -287,7 +307,8 @@ def process_pdf_with_chunker(pdf_file_path: str, output_dir: str, max_pages: Opt
 
 
 @flow
-def load_pdfs_plumber(pdf_file_path: str, output_dir: str = "output", max_pages: Optional[int] = None, debug_mode: bool = True):
+def load_pdfs_plumber(pdf_file_path: str, output_dir: str = "output", max_pages: Optional[int] = None, debug_mode: bool = True,
+                      num_workers: Optional[int] = None, use_plumber: bool = False):
     """Main flow to process PDF with simple header-based chunking
     
     Args:
@@ -295,6 +316,8 @@ def load_pdfs_plumber(pdf_file_path: str, output_dir: str = "output", max_pages:
         output_dir (str): Output directory for generated files
         max_pages (int or None): Number of pages to process. Use None or -1 for entire file
         debug_mode (bool): Whether to show detailed debug output
+        num_workers (int or None): Worker processes for page extraction. Use None to extract in-process
+        use_plumber (bool): Extract text with pdfplumber instead of pypdfium2 (slower, layout-ordered lines)
     """
     
     pages_desc = (
@@ -310,7 +333,9 @@ def load_pdfs_plumber(pdf_file_path: str, output_dir: str = "output", max_pages:
     result = process_pdf_with_chunker(
         pdf_file_path=pdf_file_path,
         output_dir=output_dir,
-        max_pages=max_pages
+        max_pages=max_pages,
+        num_workers=num_workers,
+        use_plumber=use_plumber
     )
     
     if debug_mode and result:
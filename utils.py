@@ -1,5 +1,5 @@
 from prefect.artifacts import create_markdown_artifact, create_table_artifact
-import json
+import orjson
 
 
 def print_section(title, content):
@@ -11,17 +11,20 @@ def print_section(title, content):
     print(f"{'=' * 50}\n")
 
 
-def create_json_structure_artifact(
+async def create_json_structure_artifact(
     json_content: str, title: str, key: str, description: str
 ):
-    """Create a markdown artifact for JSON structure with proper formatting"""
+    """Create a markdown artifact for JSON structure with proper formatting
+
+    Async because it is called from async tasks and flows, where Prefect's
+    `create_markdown_artifact` returns a coroutine that must be awaited.
+    """
     # Format the JSON content for better readability
-    breakpoint()
     try:
         # Parse and re-format the JSON for consistent indentation
-        parsed_json = json.loads(json_content)
-        formatted_json = json.dumps(parsed_json, indent=2)
-    except json.JSONDecodeError:
+        parsed_json = orjson.loads(json_content)
+        formatted_json = orjson.dumps(parsed_json, option=orjson.OPT_INDENT_2).decode()
+    except orjson.JSONDecodeError:
         # If it's not valid JSON, use as-is
         formatted_json = json_content
 
@@ -35,7 +38,7 @@ def create_json_structure_artifact(
 {description}
 """
 
-    create_markdown_artifact(
+    await create_markdown_artifact(
         key=key,
         markdown=markdown_content,
         description=f"{title} - Generated JSON structure for datasheet organization",
@@ -55,7 +58,7 @@ def create_headers_table_artifact(headers: list, key: str):
     create_table_artifact(
         key=key,
         table=table_data,
-        description="# Extracted Headers from PDF\n\nHeaders extracted using pdfplumber from the datasheet PDF. These provide insight into the document structure and content organization.",
+        description="# Extracted Headers from PDF\n\nHeaders extracted using pypdfium2 from the datasheet PDF. These provide insight into the document structure and content organization.",
     )
 
 
@@ -89,7 +92,7 @@ def create_content_summary_artifact(content_summary: list, key: str):
     create_table_artifact(
         key=key,
         table=table_data,
-        description="# Content Summary from PDF\n\nContent summaries extracted from each page of the datasheet PDF using pdfplumber. This provides an overview of the content on each page.",
+        description="# Content Summary from PDF\n\nContent summaries extracted from each page of the datasheet PDF using pypdfium2. This provides an overview of the content on each page.",
     )
 
 
@@ -108,7 +111,7 @@ def create_processing_summary_artifact(
 
 ## Processing Status
 ✅ PDF successfully processed  
-✅ Headers extracted using pdfplumber  
+✅ Headers extracted using pypdfium2  
 ✅ AI structure generated using OpenAI  
 ✅ Structure refined based on extracted content  
 